@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 
+import argparse
 import atexit
 import collections
+import contextlib
 import curses
+import fcntl
+import functools
+import heapq
 import json
+import operator
 import os
 import re
+import sys
+import threading
+import time
+import traceback
 
 
 import appdirs
@@ -28,15 +38,26 @@ def delete_resource(resource_name):
         del RESOURCES_DEFINED[resource_name]
     except KeyError:
         pass
-    try:
-        os.remove(filepath(resource_name))
-    except FileNotFoundError:
-        pass
+    with SHARED_STORE.lock():
+        try:
+            os.remove(filepath(resource_name))
+        except FileNotFoundError:
+            pass
+        else:
+            SHARED_STORE.bump(resource_name)
+    invalidate_BOMs([resource_name])
+    DEPENDENCY_INDEX.remove(resource_name)
+
+
+def is_defined(resource_name):
+    return resource_name in RESOURCES_DEFINED or os.path.exists(filepath(resource_name))
 
 
 def get_resource_list():
     file_resources = (
-        re.sub(".json$", "", filename) for filename in os.listdir(RESOURCES_DIR)
+        re.sub(".json$", "", filename)
+        for filename in os.listdir(RESOURCES_DIR)
+        if filename.endswith(".json")
     )
     return sorted(set(RESOURCES_DEFINED.keys()) | set(file_resources))
 
@@ -55,6 +76,119 @@ def get_resource(resource_name):
             return None
 
 
+class SharedStore:
+    """Coordinates processes sharing RESOURCES_DIR. Writers hold an exclusive
+    lock and bump a generation marker that records which resource changed in
+    which generation; readers compare it with the generation they last saw and
+    reload only the resources changed since."""
+
+    LOCK_FILE = ".lock"
+    MARKER_FILE = ".generation"
+
+    def __init__(self):
+        self.generation = None
+        self._marker_stat = None
+
+    @property
+    def marker_path(self):
+        return os.path.join(RESOURCES_DIR, self.MARKER_FILE)
+
+    @contextlib.contextmanager
+    def lock(self):
+        with open(os.path.join(RESOURCES_DIR, self.LOCK_FILE), "a") as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.marker_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def read_marker(self):
+        try:
+            with open(self.marker_path) as file:
+                marker = json.load(file)
+        except FileNotFoundError:
+            return 0, dict()
+        return marker["generation"], marker["changes"]
+
+    def bump(self, *resource_names):
+        "Record changes to `resource_names` as one generation; hold the lock"
+        generation, changes = self.read_marker()
+        for resource_name in resource_names:
+            changes[resource_name] = generation + 1
+        atomic_write_json(
+            self.marker_path, {"generation": generation + 1, "changes": changes}
+        )
+        if self.generation == generation:
+            # nobody else wrote since we last caught up, so our own write
+            # is the only news
+            self.generation = generation + 1
+            self._marker_stat = self._stat()
+
+    def changed_since_refresh(self):
+        """Names changed by any process since the last call. A stat of the
+        marker is all this costs when nothing changed."""
+        stat = self._stat()
+        if stat == self._marker_stat and self.generation is not None:
+            return set()
+        self._marker_stat = stat
+        generation, changes = self.read_marker()
+        if self.generation is None:
+            # no baseline yet, so whatever was loaded before now may be stale
+            changed = set(changes.keys()) & set(RESOURCES_DEFINED.keys())
+        else:
+            changed = {
+                resource_name
+                for resource_name, changed_in in changes.items()
+                if changed_in > self.generation
+            }
+        self.generation = generation
+        return changed
+
+
+SHARED_STORE = SharedStore()
+
+
+def atomic_write_json(path, obj):
+    "Readers see either the old file or the new one, never half of one"
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, f".{filename}.tmp")
+    with open(temp_path, "w") as file:
+        json.dump(obj, file)
+    os.replace(temp_path, path)
+
+
+def invalidate_BOMs(resource_names):
+    "Drop the cached BOMs of `resource_names` and of everything that uses them"
+    for resource in map(
+        RESOURCES_DEFINED.get, DEPENDENCY_INDEX.ancestors(resource_names)
+    ):
+        if resource is not None:
+            resource._bom = None
+
+
+def refresh_resources():
+    "Reload whatever other processes changed. Returns the changed names."
+    changed = SHARED_STORE.changed_since_refresh()
+    if len(changed) == 0:
+        return changed
+    invalidate_BOMs(changed)
+    for resource_name in changed:
+        RESOURCES_DEFINED.pop(resource_name, None)
+        resource = get_resource(resource_name)
+        if resource is None:
+            DEPENDENCY_INDEX.remove(resource_name)
+        else:
+            DEPENDENCY_INDEX.update(resource)
+    return changed
+
+
 class BillOfMaterials(collections.defaultdict):
     def __init__(self, *arg, **kwargs):
         super().__init__(None, *arg, **kwargs)
@@ -85,19 +219,31 @@ class CircularDependenciesError(Exception):
 
 class Resource:
     def __init__(self, resource_name, _dependencies):
+        """`_dependencies` is a recipe dict, a list of alternative recipe dicts, or
+        {"recipes": [...], "yields": [...]} when a recipe makes more than one unit"""
         self.resource_name = resource_name
+        yields = None
+        if isinstance(_dependencies, dict) and isinstance(
+            _dependencies.get("recipes"), list
+        ):
+            yields = _dependencies.get("yields")
+            _dependencies = _dependencies["recipes"]
+        if isinstance(_dependencies, list):
+            _dependencies, *self.alternatives = _dependencies
+        else:
+            self.alternatives = []
         self._dependencies = _dependencies
+        if yields is None:
+            yields = [1] * len(self.recipes)
+        self.yields = list(yields)
         self._bom = None
 
     def save(self):
-        with open(
-            os.path.join(RESOURCES_DIR, f"{self.resource_name}.json"), "w"
-        ) as file:
-            json.dump(self.serialize(), file)
+        save_resources([self])
 
     @property
     def defined(self):
-        return f"{self.resource_name}.json" in os.listdir(RESOURCES_DIR)
+        return os.path.exists(filepath(self.resource_name))
 
     def __str__(self):
         return self.resource_name
@@ -114,32 +260,76 @@ class Resource:
     def register(self):
         global RESOURCES_DEFINED
         RESOURCES_DEFINED[self.resource_name] = self
+        DEPENDENCY_INDEX.update(self)
+        invalidate_BOMs([self.resource_name])
 
     def serialize(self):
-        return self._dependencies
+        if any(output_yield != 1 for output_yield in self.yields):
+            return {"recipes": self.recipes, "yields": self.yields}
+        if len(self.alternatives) == 0:
+            return self._dependencies
+        return self.recipes
+
+    @property
+    def recipes(self):
+        "The active recipe first, then the alternatives"
+        return [self._dependencies] + self.alternatives
+
+    @property
+    def output_yield(self):
+        "Units made by one craft of the active recipe"
+        return self.yields[0]
+
+    @output_yield.setter
+    def output_yield(self, value):
+        self.yields[0] = value
+        self._changed()
 
     @property
     def dependencies(self):
         for dependency, quantity in self._dependencies.items():
             yield get_resource(dependency), quantity
 
+    def _changed(self):
+        "Keep the dependency index and cached BOMs in step with an edit"
+        self._bom = None
+        if self.resource_name in RESOURCES_DEFINED:
+            DEPENDENCY_INDEX.update(self)
+            invalidate_BOMs([self.resource_name])
+
     def add_dependency(self, dependency, quantity):
         self.check_loop(dependency)
         self._dependencies[dependency] = quantity
+        self._changed()
+
+    def remove_dependency(self, dependency):
+        del self._dependencies[dependency]
+        self._changed()
+
+    def add_recipe(self, recipe, output_yield=1):
+        for dependency in recipe.keys():
+            self.check_loop(dependency)
+        self.alternatives.append(recipe)
+        self.yields.append(output_yield)
+        self._changed()
+
+    def use_recipe(self, index):
+        "Make recipe `index` of `recipes` the active one"
+        recipes = self.recipes
+        self._dependencies = recipes.pop(index)
+        self.alternatives = recipes
+        self.yields.insert(0, self.yields.pop(index))
+        self._changed()
+
+    def demand(self, q=1, force_update=False):
+        """propagate_demand over the stored recipes. Rounding to whole crafts makes
+        it non-linear in q, so only the last q asked for is cached."""
+        if self._bom is None or self._bom[0] != q or force_update:
+            self._bom = (q, propagate_demand(self, q))
+        return self._bom[1]
 
     def get_BOM(self, q=1, force_update=False):
-        BOM = BillOfMaterials()
-        if len(self._dependencies) == 0:
-            BOM[self] += q
-            return BOM
-        if self._bom is not None and not force_update:
-            return self._bom * q
-
-        for dependency, quantity in self.dependencies:
-            dependency_BOM = dependency.get_BOM(quantity, force_update)
-            BOM += dependency_BOM
-        self._bom = BOM
-        return BOM * q
+        return BillOfMaterials(self.demand(q, force_update)[3])
 
     def check_loop(self, maybe_add):
         start_node = get_resource(maybe_add)
@@ -151,62 +341,821 @@ class Resource:
             raise CircularDependenciesError
 
     def _children_dependencies(self):
-        for child, quantity in self.dependencies:
-            if child is not None:
-                yield from child._children_dependencies()
-                yield child
+        "Everything reachable through any recipe, each yielded once"
+        seen = set()
+        stack = [self]
+        while stack:
+            resource = stack.pop()
+            for recipe in resource.recipes:
+                for child in map(get_resource, recipe.keys()):
+                    if child is not None and child not in seen:
+                        seen.add(child)
+                        stack.append(child)
+                        yield child
+
+
+def _write_resources(resources):
+    "Helper: the caller must hold the store lock"
+    resource_names = []
+    for resource in resources:
+        atomic_write_json(filepath(resource.resource_name), resource.serialize())
+        resource_names.append(resource.resource_name)
+    if len(resource_names) > 0:
+        SHARED_STORE.bump(*resource_names)
+
+
+def save_resources(resources):
+    "Write several resources under one lock and a single marker bump"
+    with SHARED_STORE.lock():
+        _write_resources(resources)
 
 
 def dump_all():
     "Don't waste my time having to re-enter values"
-    global RESOURCES_DEFINED
-    for resource in RESOURCES_DEFINED.values():
-        if not resource.defined:
-            resource.save()
+    with SHARED_STORE.lock():
+        # catch up first so resources deleted by another process since we
+        # last looked are dropped rather than written back
+        refresh_resources()
+        _write_resources(
+            [
+                resource
+                for resource in RESOURCES_DEFINED.values()
+                if not resource.defined
+            ]
+        )
 
 
 atexit.register(dump_all)
 
 
-def _build_plan(resource, top_quantity, level, hierarchy):
-    "Helper"
-    plan = BillOfMaterials()
-    plan[resource] += top_quantity
-    hierarchy[resource] = max(level, hierarchy.get(resource, level))
-    for dependency, quantity in resource.dependencies:
-        sub_count = _build_plan(
-            dependency, quantity * top_quantity, level + 1, hierarchy
-        )
-        plan += sub_count
-    return plan
-
-
-def build_plan(resource, quantity):
-    "Order in which to build resources and in what quantity to achieve the end goal"
-    hierarchy = dict()
-    b = _build_plan(resource, quantity, 0, hierarchy)
-    parts = ((key, value) for key, value in b.items())
-    return sorted(parts, key=lambda part: hierarchy[part[0]], reverse=True)
+def _topological_order(resource, dependencies):
+    "Helper: everything reachable from `resource`, each after all of its users"
+    children = dict()
+    order = []
+    stack = [(resource, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if node in children:
+            continue
+        children[node] = list(dependencies(node))
+        stack.append((node, True))
+        stack.extend((child, False) for child, _ in children[node])
+    order.reverse()
+    return order, children
+
+
+def propagate_demand(resource, quantity, dependencies=None, output_yield=None):
+    """Push `quantity` of `resource` down the graph in one topological pass.
+    Demand from every parent is summed before a resource's crafts are rounded
+    up, so shared sub-components are never rounded once per path.
+    `dependencies` maps a resource to its (dependency, quantity) pairs and
+    `output_yield` to its units per craft, defaulting to the stored recipe.
+    Returns (order, level, made, raw): resources parents first, their depth,
+    units made (crafted or gathered) of each, and the raw materials needed."""
+    if dependencies is None:
+        dependencies = Resource.dependencies.fget
+    if output_yield is None:
+        output_yield = Resource.output_yield.fget
+    order, children = _topological_order(resource, dependencies)
+    demand = BillOfMaterials()
+    demand[resource] = quantity
+    level = {resource: 0}
+    made = BillOfMaterials()
+    raw = BillOfMaterials()
+    for node in order:
+        if len(children[node]) == 0:
+            made[node] = raw[node] = demand[node]
+            continue
+        per_craft = output_yield(node)
+        crafts = -(-demand[node] // per_craft)
+        made[node] = crafts * per_craft
+        for child, child_quantity in children[node]:
+            demand[child] += crafts * child_quantity
+            level[child] = max(level.get(child, 0), level[node] + 1)
+    return order, level, made, raw
+
+
+def iter_build_plan(resource, quantity, dependencies=None, output_yield=None):
+    """Yield build_plan's (resource, quantity) rows, deepest level first. Rows are
+    bucketed by level rather than sorted, and handed out lazily so a writer can
+    stream them, though the demand pass behind them holds every node."""
+    order, level, made, _ = propagate_demand(
+        resource, quantity, dependencies, output_yield
+    )
+    buckets = collections.defaultdict(list)
+    for node in order:
+        buckets[level[node]].append(node)
+    for depth in sorted(buckets, reverse=True):
+        for node in buckets.pop(depth):
+            yield node, made[node]
+
+
+def build_plan(resource, quantity, dependencies=None, output_yield=None):
+    """Order in which to build resources and in what quantity to achieve the end goal.
+    See propagate_demand for `dependencies` and `output_yield`."""
+    return list(iter_build_plan(resource, quantity, dependencies, output_yield))
+
+
+def iter_BOM(resource, quantity, force_update=False):
+    "Yield the (resource, quantity) rows of the bill of materials, sorted by name"
+    bom = resource.get_BOM(quantity, force_update)
+    for item in sorted(bom, key=lambda item: item.resource_name):
+        yield item, bom[item]
+
+
+def format_row(item, quantity):
+    return f"{item}: {quantity:,}"
+
+
+def write_rows(rows, file):
+    "Stream (resource, quantity) rows to `file`, one per line"
+    for item, quantity in rows:
+        file.write(format_row(item, quantity))
+        file.write("\n")
+
+
+def missing_dependencies(resource):
+    "Names reachable from `resource` through its active recipes that aren't defined"
+    missing = set()
+    seen = {resource.resource_name}
+    stack = [resource]
+    while stack:
+        for dependency in stack.pop()._dependencies.keys():
+            if dependency in seen:
+                continue
+            seen.add(dependency)
+            child = get_resource(dependency)
+            if child is None:
+                missing.add(dependency)
+            else:
+                stack.append(child)
+    return missing
 
 
 def BOM(resource, quantity, update):
     return get_resource(resource).get_BOM(quantity)
 
 
-def build_reverse_dependency_tree():
+# one chunk of a plan step on one machine; a step may be split over several
+ScheduledStep = collections.namedtuple(
+    "ScheduledStep", "resource quantity station machine start finish"
+)
+
+
+class BuildSchedule:
+    def __init__(self, steps, stations):
+        self.steps = steps
+        self.stations = stations
+        self.makespan = max((step.finish for step in steps), default=0)
+        busy = collections.defaultdict(float)
+        for step in steps:
+            busy[step.station] += step.finish - step.start
+        self.utilization = {
+            station: busy[station] / (count * self.makespan) if self.makespan else 0
+            for station, count in stations.items()
+        }
+
+    def __str__(self):
+        lines = [f"Total time: {self.makespan:,}"]
+        for station, utilization in sorted(self.utilization.items()):
+            lines.append(f"{station} x{self.stations[station]}: {utilization:.0%} busy")
+        for step in self.steps:
+            if step.station is not None:
+                lines.append(
+                    f"{step.start:,}-{step.finish:,} {step.station}#{step.machine}: "
+                    f"{step.resource}: {step.quantity:,}"
+                )
+        return "\n".join(lines)
+
+
+def schedule_plan(
+    plan,
+    durations,
+    stations=1,
+    station_for=None,
+    default_duration=1,
+    dependencies=None,
+    output_yield=None,
+):
+    """Spread a build_plan over parallel crafting stations.
+    `durations` is the time per craft by resource name; crafted resources not
+    listed take `default_duration` and raw materials take nothing. `stations` is
+    either a machine count or {station: machine count}, with `station_for`
+    mapping resource names to stations. Ready steps are served longest
+    remaining critical path first whenever a machine of their station frees up.
+    A step's crafts are split into chunks that run on several machines at
+    once. While more steps are waiting than the station has machines, each
+    step runs whole. Otherwise a chunk is at most 1/N of the step on N
+    machines, and a step takes larger chunks of the machines no other
+    waiting step needs."""
+    if dependencies is None:
+        dependencies = Resource.dependencies.fget
+    if output_yield is None:
+        output_yield = Resource.output_yield.fget
+    if not isinstance(stations, dict):
+        stations = {"station": stations}
+    for name, machines in stations.items():
+        if machines < 1:
+            raise ValueError(f"{name} needs at least one machine, not {machines}")
+    if station_for is None:
+        station_for = dict()
+    only_station = next(iter(stations)) if len(stations) == 1 else None
+
+    count = len(plan)
+    index = {resource: i for i, (resource, _) in enumerate(plan)}
+    dependents = [[] for _ in range(count)]
+    waiting_on = [0] * count
+    crafts_left = [0] * count
+    units_per_craft = [1] * count
+    per_craft = [0] * count
+    largest_chunk = [0] * count
+    station = [None] * count
+    for i, (resource, quantity) in enumerate(plan):
+        children = [index[child] for child, _ in dependencies(resource)]
+        for child in children:
+            dependents[child].append(i)
+        waiting_on[i] = len(children)
+        name = resource.resource_name
+        crafts_left[i] = quantity
+        if len(children) > 0:
+            units_per_craft[i] = output_yield(resource)
+            crafts_left[i] = -(-quantity // units_per_craft[i])
+        if name in durations:
+            per_craft[i] = durations[name]
+        elif len(children) > 0:
+            per_craft[i] = default_duration
+        if per_craft[i] > 0 and crafts_left[i] > 0:
+            station[i] = station_for.get(name, only_station)
+            if station[i] not in stations:
+                raise KeyError(f"No station given for {name}")
+            largest_chunk[i] = -(-crafts_left[i] // stations[station[i]])
+
+    # build plans list dependencies first, so walking backwards sees parents
+    # before children
+    critical_path = [0] * count
+    for i in reversed(range(count)):
+        critical_path[i] = per_craft[i] * largest_chunk[i] + max(
+            (critical_path[parent] for parent in dependents[i]), default=0
+        )
 
-    reverse_dependency_tree = collections.defaultdict(lambda: [])
-    for resource in map(get_resource, get_resource_list()):
-        for depedency in resource._dependencies.keys():
-            reverse_dependency_tree[depedency].append(resource)
-    return reverse_dependency_tree
+    free_machines = {name: list(range(machines)) for name, machines in stations.items()}
+    ready = {name: [] for name in stations}
+    running = []
+    in_progress = [0] * count
+    steps = []
+    now = 0
+
+    def make_ready(i):
+        if station[i] is None:
+            # takes no time, so done as soon as its inputs are
+            heapq.heappush(running, (now, i, None))
+            crafts_left[i] = 0
+            in_progress[i] = 1
+            steps.append(ScheduledStep(*plan[i], None, None, now, now))
+        else:
+            heapq.heappush(ready[station[i]], (-critical_path[i], i))
+
+    for i in range(count):
+        if waiting_on[i] == 0:
+            make_ready(i)
+    while True:
+        for name, queue in ready.items():
+            machines = free_machines[name]
+            while queue and machines:
+                i = queue[0][1]
+                if len(queue) > stations[name]:
+                    # enough other work to keep every machine busy
+                    chunk = crafts_left[i]
+                else:
+                    # machines no other waiting step needs can go to this one
+                    spare = max(1, len(machines) - (len(queue) - 1))
+                    chunk = min(largest_chunk[i], -(-crafts_left[i] // spare))
+                crafts_left[i] -= chunk
+                if crafts_left[i] == 0:
+                    heapq.heappop(queue)
+                machine = heapq.heappop(machines)
+                finish = now + per_craft[i] * chunk
+                steps.append(
+                    ScheduledStep(
+                        plan[i][0],
+                        chunk * units_per_craft[i],
+                        name,
+                        machine,
+                        now,
+                        finish,
+                    )
+                )
+                in_progress[i] += 1
+                heapq.heappush(running, (finish, i, machine))
+        if not running:
+            break
+        now = running[0][0]
+        # retire everything finishing now before handing out machines
+        while running and running[0][0] == now:
+            _, i, machine = heapq.heappop(running)
+            if machine is not None:
+                heapq.heappush(free_machines[station[i]], machine)
+            in_progress[i] -= 1
+            if in_progress[i] > 0 or crafts_left[i] > 0:
+                continue
+            for parent in dependents[i]:
+                waiting_on[parent] -= 1
+                if waiting_on[parent] == 0:
+                    make_ready(parent)
+
+    steps.sort(key=operator.itemgetter(4, 5))
+    return BuildSchedule(steps, stations)
+
+
+class DependencyIndex:
+    """Reverse dependency edges plus the set of names that are depended on but
+    not defined. Kept up to date by register/delete/rename so finding holes
+    never needs a walk of the whole graph."""
+
+    def __init__(self):
+        self.dependents = collections.defaultdict(set)
+        self.dependencies = dict()
+        self.dangling = set()
+        self.loaded = False
+
+    def load(self):
+        "One full scan, done lazily the first time the index is queried"
+        self.loaded = True
+        for resource_name in get_resource_list():
+            resource = get_resource(resource_name)
+            if resource is not None:
+                self.update(resource)
+
+    def _link(self, parent, dependency):
+        self.dependents[dependency].add(parent)
+        self.dependencies[parent].add(dependency)
+        if not is_defined(dependency):
+            self.dangling.add(dependency)
+
+    def _unlink(self, parent, dependency):
+        self.dependents[dependency].discard(parent)
+        self.dependencies[parent].discard(dependency)
+        if len(self.dependents[dependency]) == 0:
+            del self.dependents[dependency]
+            self.dangling.discard(dependency)
+
+    def update(self, resource):
+        if not self.loaded:
+            return
+        resource_name = resource.resource_name
+        old = self.dependencies.setdefault(resource_name, set())
+        new = set().union(*resource.recipes)
+        for dependency in old - new:
+            self._unlink(resource_name, dependency)
+        for dependency in new - old:
+            self._link(resource_name, dependency)
+        self.dangling.discard(resource_name)
+
+    def remove(self, resource_name):
+        if not self.loaded:
+            return
+        for dependency in list(self.dependencies.get(resource_name, ())):
+            self._unlink(resource_name, dependency)
+        self.dependencies.pop(resource_name, None)
+        if resource_name in self.dependents:
+            self.dangling.add(resource_name)
+
+    def get_dependents(self, resource_name):
+        if not self.loaded:
+            self.load()
+        return set(self.dependents.get(resource_name, ()))
+
+    def ancestors(self, resource_names):
+        "`resource_names` and everything that (transitively) depends on them"
+        found = set()
+        stack = list(resource_names)
+        while stack:
+            resource_name = stack.pop()
+            if resource_name in found:
+                continue
+            found.add(resource_name)
+            stack.extend(self.get_dependents(resource_name))
+        return found
+
+    def get_dangling(self):
+        if not self.loaded:
+            self.load()
+        return self.dangling
+
+
+DEPENDENCY_INDEX = DependencyIndex()
 
 
 def replace_name(original, new):
-    rdep_tree = build_reverse_dependency_tree()
-    for parent in rdep_tree[original]:
-        quantity = parent._dependencies.pop(original)
-        parent._dependencies[new] = quantity
+    for parent_name in DEPENDENCY_INDEX.get_dependents(original):
+        parent = get_resource(parent_name)
+        for recipe in parent.recipes:
+            if original in recipe:
+                recipe[new] = recipe.pop(original)
+        DEPENDENCY_INDEX.update(parent)
+
+
+class Scenario:
+    """Copy-on-write what-if overlay on top of the stored recipes.
+    Only changed edges are recorded; a quantity of None marks a removed edge.
+    The stored resources are never touched."""
+
+    REMOVED = None
+
+    def __init__(self, name=""):
+        self.name = name
+        self.overrides = collections.defaultdict(dict)
+        self.yields = dict()
+
+    def set_dependency(self, resource_name, dependency, quantity):
+        if dependency == resource_name or self._reachable(dependency, resource_name):
+            raise CircularDependenciesError
+        self.overrides[resource_name][dependency] = quantity
+
+    def remove_dependency(self, resource_name, dependency):
+        self.overrides[resource_name][dependency] = self.REMOVED
+
+    def set_yield(self, resource_name, output_yield):
+        self.yields[resource_name] = output_yield
+
+    def set_recipe(self, resource_name, recipe, output_yield=None):
+        """Replace every edge of a resource at once. `recipe` is trusted to be
+        loop-free, as the alternatives accepted by Resource.add_recipe are."""
+        if output_yield is not None:
+            self.yields[resource_name] = output_yield
+        resource = get_resource(resource_name)
+        edges = dict()
+        if resource is not None:
+            edges.update(
+                (dependency, self.REMOVED) for dependency in resource._dependencies
+            )
+        edges.update(recipe)
+        self.overrides[resource_name] = edges
+
+    @classmethod
+    def from_choices(cls, choices, name=""):
+        "Overlay selecting recipe `choices[resource_name]` for each resource"
+        scenario = cls(name)
+        for resource_name, index in choices.items():
+            if index != 0:
+                resource = get_resource(resource_name)
+                scenario.set_recipe(
+                    resource_name, resource.recipes[index], resource.yields[index]
+                )
+        return scenario
+
+    def reset(self, resource_name, dependency=None):
+        "Drop overrides for a resource, or for a single edge of it"
+        if dependency is None:
+            self.overrides.pop(resource_name, None)
+            self.yields.pop(resource_name, None)
+        else:
+            edges = self.overrides.get(resource_name, dict())
+            edges.pop(dependency, None)
+            if len(edges) == 0:
+                self.overrides.pop(resource_name, None)
+
+    def discard(self):
+        self.overrides.clear()
+        self.yields.clear()
+
+    def get_dependencies(self, resource_name):
+        resource = get_resource(resource_name)
+        if resource_name not in self.overrides:
+            return resource._dependencies if resource is not None else dict()
+        merged = dict(resource._dependencies) if resource is not None else dict()
+        for dependency, quantity in self.overrides[resource_name].items():
+            if quantity is self.REMOVED:
+                merged.pop(dependency, None)
+            else:
+                merged[dependency] = quantity
+        return merged
+
+    def dependencies(self, resource):
+        "Drop-in for Resource.dependencies, for use with build_plan"
+        for dependency, quantity in self.get_dependencies(
+            resource.resource_name
+        ).items():
+            yield get_resource(dependency), quantity
+
+    def output_yield(self, resource):
+        "Drop-in for Resource.output_yield, for use with build_plan"
+        try:
+            return self.yields[resource.resource_name]
+        except KeyError:
+            return resource.output_yield
+
+    def _reachable(self, start, target):
+        seen = set()
+        stack = [start]
+        while stack:
+            resource_name = stack.pop()
+            if resource_name == target:
+                return True
+            if resource_name in seen:
+                continue
+            seen.add(resource_name)
+            stack.extend(self.get_dependencies(resource_name).keys())
+        return False
+
+    def diff(self):
+        "{resource_name: {dependency: (base quantity, scenario quantity)}}"
+        changes = dict()
+        for resource_name, edges in self.overrides.items():
+            resource = get_resource(resource_name)
+            base = resource._dependencies if resource is not None else dict()
+            for dependency, quantity in edges.items():
+                base_quantity = base.get(dependency)
+                if base_quantity != quantity:
+                    changes.setdefault(resource_name, dict())[dependency] = (
+                        base_quantity,
+                        quantity,
+                    )
+        return changes
+
+    def yield_diff(self):
+        "{resource_name: (base yield, scenario yield)}"
+        return {
+            resource_name: (get_resource(resource_name).output_yield, output_yield)
+            for resource_name, output_yield in self.yields.items()
+            if get_resource(resource_name).output_yield != output_yield
+        }
+
+    def _downstream(self, resource_names):
+        "Everything reachable from `resource_names` through stored or overlay edges"
+        found = set()
+        stack = list(resource_names)
+        while stack:
+            resource_name = stack.pop()
+            if resource_name in found:
+                continue
+            found.add(resource_name)
+            resource = get_resource(resource_name)
+            if resource is not None:
+                stack.extend(resource._dependencies.keys())
+            stack.extend(self.get_dependencies(resource_name).keys())
+        return found
+
+    def _topological_names(self, resource_names):
+        "Helper: `resource_names` ordered parents first along overlay edges"
+        order = []
+        done = set()
+        for start in resource_names:
+            stack = [(start, False)]
+            while stack:
+                resource_name, expanded = stack.pop()
+                if expanded:
+                    order.append(resource_name)
+                    continue
+                if resource_name in done:
+                    continue
+                done.add(resource_name)
+                stack.append((resource_name, True))
+                stack.extend(
+                    (dependency, False)
+                    for dependency in self.get_dependencies(resource_name).keys()
+                    if dependency in resource_names and dependency not in done
+                )
+        order.reverse()
+        return order
+
+    def demand(self, resource_name, q=1):
+        """propagate_demand for the overlay, returning the same
+        (order, level, made, raw). Nothing outside what the overrides lead to
+        gets different demand or depth than in the stored graph, so the stored
+        pass (cached by Resource.demand) is reused and only the resources
+        downstream of an override are recomputed."""
+        base_order, base_level, base_made, base_raw = get_resource(
+            resource_name
+        ).demand(q)
+        base_reached = {node.resource_name: node for node in base_order}
+        overridden = set(self.overrides.keys()) | set(self.yields.keys())
+        # an override only matters once demand reaches it along stored edges
+        downstream = self._downstream(overridden & base_reached.keys())
+        if len(downstream) == 0:
+            return base_order, base_level, base_made, base_raw
+
+        demand = BillOfMaterials()
+        depth = dict()
+        reached = set()
+        if resource_name in downstream:
+            demand[resource_name] = q
+            depth[resource_name] = 0
+            reached.add(resource_name)
+        for name in downstream:
+            # seed with what untouched parents asked for in the stored pass
+            for parent_name in DEPENDENCY_INDEX.get_dependents(name):
+                parent = base_reached.get(parent_name)
+                if parent is None or parent_name in downstream:
+                    continue
+                if name not in parent._dependencies:
+                    continue
+                crafts = base_made[parent] // parent.output_yield
+                demand[name] += crafts * parent._dependencies[name]
+                depth[name] = max(depth.get(name, 0), base_level[parent] + 1)
+                reached.add(name)
+
+        # untouched resources can't depend on downstream ones, so they stay
+        # ahead of them in the order
+        order = [node for node in base_order if node.resource_name not in downstream]
+        level = {node: base_level[node] for node in order}
+        made = BillOfMaterials((node, base_made[node]) for node in order)
+        raw = BillOfMaterials(
+            (node, quantity)
+            for node, quantity in base_raw.items()
+            if node.resource_name not in downstream
+        )
+        for name in self._topological_names(downstream):
+            if name not in reached:
+                continue
+            node = get_resource(name)
+            order.append(node)
+            level[node] = depth[name]
+            dependencies = self.get_dependencies(name)
+            if len(dependencies) == 0:
+                made[node] = raw[node] = demand[name]
+                continue
+            per_craft = self.output_yield(node)
+            crafts = -(-demand[name] // per_craft)
+            made[node] = crafts * per_craft
+            for dependency, quantity in dependencies.items():
+                demand[dependency] += crafts * quantity
+                depth[dependency] = max(depth.get(dependency, 0), depth[name] + 1)
+                reached.add(dependency)
+        return order, level, made, raw
+
+    def get_BOM(self, resource_name, q=1):
+        return BillOfMaterials(self.demand(resource_name, q)[3])
+
+    def build_plan(self, resource_name, quantity):
+        "Same order as build_plan, from the incremental pass"
+        order, level, made, _ = self.demand(resource_name, quantity)
+        parts = ((node, made[node]) for node in order)
+        return sorted(parts, key=lambda part: level[part[0]], reverse=True)
+
+
+def choose_recipes(resource_name, weights=None, default_weight=1):
+    """Pick, for every resource reachable from `resource_name`, the recipe that
+    minimizes total raw material cost. Raw materials (and empty recipes) cost
+    `weights[name]`, falling back to `default_weight`, and a recipe's cost is per
+    unit made (batch rounding is left to propagate_demand). Each resource is solved
+    once, children before parents. Returns (cost, {resource_name: recipe index});
+    feed the choices to Scenario.from_choices for BOMs and build plans."""
+    if weights is None:
+        weights = dict()
+    cost = dict()
+    choices = dict()
+    stack = [(resource_name, False)]
+    while stack:
+        name, expanded = stack.pop()
+        if name in cost:
+            continue
+        resource = get_resource(name)
+        recipes = resource.recipes if resource is not None else [dict()]
+        yields = resource.yields if resource is not None else [1]
+        if not expanded:
+            stack.append((name, True))
+            for recipe in recipes:
+                stack.extend((dependency, False) for dependency in recipe.keys())
+            continue
+        best = None
+        for index, recipe in enumerate(recipes):
+            if len(recipe) == 0:
+                recipe_cost = weights.get(name, default_weight)
+            else:
+                recipe_cost = (
+                    sum(
+                        quantity * cost[dependency]
+                        for dependency, quantity in recipe.items()
+                    )
+                    / yields[index]
+                )
+            if best is None or recipe_cost < best[0]:
+                best = (recipe_cost, index)
+        cost[name], choices[name] = best
+    return cost[resource_name], choices
+
+
+# @Profiling
+
+
+class HandlerProfiler:
+    """Per-handler latency histograms for the TUI, switched on by setting
+    GLEAN_PROFILE. While a handler runs, a background thread samples the main
+    thread's stack so the slowest calls can be reported with where they spent
+    their time. The report is written to the state dir on exit."""
+
+    BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+    SLOWEST = 10
+    SAMPLE_INTERVAL = 0.005
+    STACK_DEPTH = 8
+
+    def __init__(self, report_path):
+        self.report_path = report_path
+        self.histograms = collections.defaultdict(
+            lambda: [0] * (len(self.BUCKETS_MS) + 1)
+        )
+        self.total_time = collections.defaultdict(float)
+        self.max_time = collections.defaultdict(float)
+        self.slowest = []
+        self._calls = 0
+        self._active = []
+        self._main_thread = threading.main_thread().ident
+        threading.Thread(target=self._sample, daemon=True).start()
+
+    def _sample(self):
+        while True:
+            time.sleep(self.SAMPLE_INTERVAL)
+            active = list(self._active)
+            if len(active) == 0:
+                continue
+            frame = sys._current_frames().get(self._main_thread)
+            if frame is not None:
+                stack = traceback.extract_stack(frame, limit=self.STACK_DEPTH)
+                stack = "".join(traceback.format_list(stack))
+                # nested handlers are each charged for the sample
+                for samples in active:
+                    samples[stack] += 1
+
+    def wrap(self, handler_name, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            samples = collections.Counter()
+            self._active.append(samples)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._active.pop()
+                self.record(handler_name, elapsed, samples)
+
+        return wrapper
+
+    def record(self, handler_name, elapsed, samples):
+        elapsed_ms = elapsed * 1000
+        bucket = 0
+        while bucket < len(self.BUCKETS_MS) and elapsed_ms >= self.BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histograms[handler_name][bucket] += 1
+        self.total_time[handler_name] += elapsed_ms
+        self.max_time[handler_name] = max(self.max_time[handler_name], elapsed_ms)
+        self._calls += 1
+        entry = (elapsed_ms, self._calls, handler_name, samples)
+        if len(self.slowest) < self.SLOWEST:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def report(self):
+        labels = [f"< {ms}ms" for ms in self.BUCKETS_MS]
+        labels.append(f">= {self.BUCKETS_MS[-1]}ms")
+        lines = []
+        for handler_name, histogram in sorted(self.histograms.items()):
+            count = sum(histogram)
+            lines.append(
+                f"{handler_name}: {count:,} calls, "
+                f"mean {self.total_time[handler_name] / count:.2f}ms, "
+                f"max {self.max_time[handler_name]:.2f}ms"
+            )
+            for label, bucket_count in zip(labels, histogram):
+                if bucket_count:
+                    lines.append(
+                        f"  {label:>10} {bucket_count:>8,} {'#' * bucket_count}"[:80]
+                    )
+            lines.append("")
+        lines.append(f"Slowest {len(self.slowest)} calls")
+        for elapsed_ms, _, handler_name, samples in sorted(self.slowest, reverse=True):
+            lines.append(f"{handler_name}: {elapsed_ms:.2f}ms")
+            for stack, hits in samples.most_common(3):
+                lines.append(f"  {hits} sample(s) at:")
+                lines.extend(f"  {line}" for line in stack.splitlines())
+            lines.append("")
+        return "\n".join(lines)
+
+    def write_report(self):
+        with open(self.report_path, "w") as file:
+            file.write(self.report())
+
+
+PROFILER = None
+if os.environ.get("GLEAN_PROFILE"):
+    PROFILER = HandlerProfiler(os.path.join(GLEAN_DIRS.user_state_dir, "profile.txt"))
+    atexit.register(PROFILER.write_report)
+
+
+def profiled(handler_name):
+    "Time the decorated handler when profiling is on; otherwise a no-op"
+
+    def decorator(function):
+        if PROFILER is None:
+            return function
+        return PROFILER.wrap(handler_name, function)
+
+    return decorator
 
 
 # @App definition
@@ -244,7 +1193,7 @@ class GleanApp(npyscreen.NPSAppManaged):
         self.push(resource_name)
         self.original_name = self.top()
         old = get_resource(self.top())
-        self.last_resource_object = Resource(old.resource_name, old._dependencies)
+        self.last_resource_object = Resource(old.resource_name, old.serialize())
         self.save_place = False
         self.switchForm("MODIFY")
         self.changed = True
@@ -259,14 +1208,21 @@ class GleanApp(npyscreen.NPSAppManaged):
     def top(self):
         return self.active_resource[-1]
 
-    def mark_missing_dependencies(self, resource_name):
+    def mark_missing_dependencies(self, resource_name, seen=None):
+        if len(DEPENDENCY_INDEX.get_dangling()) == 0:
+            return
+        if seen is None:
+            seen = set()
+        if resource_name in seen:
+            return
+        seen.add(resource_name)
         resource = get_resource(resource_name)
         if resource is None:
             self.push(resource_name)
             return
 
         for dependency in resource._dependencies.keys():
-            self.mark_missing_dependencies(dependency)
+            self.mark_missing_dependencies(dependency, seen)
 
 
 # @Utils
@@ -276,6 +1232,7 @@ class Search(npyscreen.ActionControllerSimple):
     def create(self):
         self.add_action("^/.*", self.set_search, True)
 
+    @profiled("search filter")
     def set_search(self, command_line, widget_proxy, live):
         self.parent.resource_listing.set_filter(command_line[1:])
         self.parent.update_listing()
@@ -284,6 +1241,7 @@ class Search(npyscreen.ActionControllerSimple):
 
 
 class GleanAutocomplete(npyscreen.Autocomplete):
+    @profiled("autocomplete")
     def auto_complete(self, _input):
         candidates = [
             resource
@@ -377,6 +1335,7 @@ class _AddDeleteModifyList(npyscreen.MultiLineAction):
 
 
 class _FilterableResourceListing(_AddDeleteModifyList):
+    @profiled("listing refresh")
     def update_listing(self):
         self.values = list(get_resource_list())
         self.display()
@@ -449,6 +1408,7 @@ class _DependencyListing(_AddDeleteModifyList):
     def display_value(self, value):
         return "{}: {:,}".format(*value)
 
+    @profiled("listing refresh")
     def update_listing(self):
         self.values = sorted(
             map(list, self.pa.last_resource_object._dependencies.items()),
@@ -469,7 +1429,7 @@ class _DependencyListing(_AddDeleteModifyList):
 
     def delete(self, _input):
         dependency_name = self.values[self.cursor_line][0]
-        del self.pa.last_resource_object._dependencies[dependency_name]
+        self.pa.last_resource_object.remove_dependency(dependency_name)
         self.update_listing()
 
 
@@ -478,6 +1438,7 @@ class DependencyListing(FilterableResourceListing):
 
 
 class _DependencyListingFixed(npyscreen.MultiLineAction):
+    @profiled("listing refresh")
     def update_listing(self):
         self.values = list(
             map(list, self.parent.resource_looked_at._dependencies.items())
@@ -580,12 +1541,16 @@ class ModifyResource(npyscreen.ActionFormV2):
     def create(self):
 
         self.resource_name = self.add(PressToChange)
+        self.output_yield = self.add(npyscreen.TitleText, name="Yield")
         self.dependency_listing = self.add(DependencyListing)
 
     def beforeEditing(self):
         if not self.parentApp.save_place:
             self.preserve_selected_widget = False
             self.parentApp.save_place = True
+            self.output_yield.value = str(
+                self.parentApp.last_resource_object.output_yield
+            )
         else:
             self.preserve_selected_widget = True
 
@@ -597,11 +1562,26 @@ class ModifyResource(npyscreen.ActionFormV2):
         self.name_changed = True
         self.parentApp.pop()
 
+    def apply_yield(self):
+        try:
+            output_yield = int(self.output_yield.value)
+        except ValueError:
+            output_yield = 0
+        if output_yield < 1:
+            npyscreen.notify_confirm(
+                "Not a positive number: {}".format(self.output_yield.value), "Error!"
+            )
+            return False
+        self.parentApp.last_resource_object.output_yield = output_yield
+        return True
+
     def on_ok(self):
 
         if self.parentApp.last_resource_object.resource_name == "":
             npyscreen.notify_confirm("Please input a name", "Alert")
             return
+        if not self.apply_yield():
+            return
 
         self.parentApp.pop()
         if self.parentApp.original_name is not None:
@@ -630,6 +1610,7 @@ class AddResourceQueue(ModifyResource):
         self.resource_name = self.add(
             npyscreen.TitleText, editable=False, name="Resource"
         )
+        self.output_yield = self.add(npyscreen.TitleText, name="Yield")
         self.dependency_listing = self.add(DependencyListing)
 
     def beforeEditing(self):
@@ -644,6 +1625,8 @@ class AddResourceQueue(ModifyResource):
 
     def on_ok(self):
 
+        if not self.apply_yield():
+            return
         self.parentApp.last_resource_object.register()
         self.parentApp.pop()
         for dependency in self.parentApp.last_resource_object._dependencies.keys():
@@ -700,8 +1683,17 @@ class ResourceDetails(npyscreen.Form):
         if self.parentApp.last_command_text is not None:
             self.parentApp.switchForm("INFO")
             return
+        refresh_resources()
         self.resource_looked_at = get_resource(self.parentApp.top())
+        if self.resource_looked_at is None:
+            npyscreen.notify_confirm("Resource was deleted elsewhere", "Alert")
+            self.on_ok()
+            return
         self.resource_name.value = self.resource_looked_at.resource_name
+        if self.resource_looked_at.output_yield != 1:
+            self.resource_name.value += (
+                f" (makes {self.resource_looked_at.output_yield:,} per craft)"
+            )
         self.resource_name.display()
         self.BOM.value = ""
         self.build_plan.value = ""
@@ -718,23 +1710,23 @@ class ResourceDetails(npyscreen.Form):
         self.parentApp.last_info_command = self.bom_set_command_text
         self.handle_info(quantity)
 
+    @profiled("BOM")
     def bom_set_command_text(self):
         resource_name = self.parentApp.top()
         quantity = self.parentApp.last_requested_quanitity
-        bom = get_resource(resource_name).get_BOM(quantity, self.parentApp.changed)
-        prelim_items = ((k.resource_name, v) for k, v in bom.items())
-        items = sorted(prelim_items, key=lambda pair: pair[0])
+        items = iter_BOM(get_resource(resource_name), quantity, self.parentApp.changed)
         self.parentApp.last_command_text = "\n".join(
-            f"{item}: {quantity:,}" for item, quantity in items
+            format_row(item, quantity) for item, quantity in items
         )
 
+    @profiled("plan")
     def build_plan_set_command_text(self):
         resource_name = self.parentApp.top()
         quantity = self.parentApp.last_requested_quanitity
-        items = build_plan(get_resource(resource_name), quantity)
+        items = iter_build_plan(get_resource(resource_name), quantity)
 
         self.parentApp.last_command_text = "\n".join(
-            f"{item}: {quantity:,}" for item, quantity in items
+            format_row(item, quantity) for item, quantity in items
         )
 
     def handle_maybe_missing_resources(self):
@@ -797,6 +1789,7 @@ class MainResourceList(npyscreen.FormMuttActive):
         self.resource_listing = npyscreen.NPSFilteredDataList()
         self.update_listing()
 
+    @profiled("listing refresh")
     def update_listing(self):
         if self.parentApp.changed:
 
@@ -805,22 +1798,112 @@ class MainResourceList(npyscreen.FormMuttActive):
             self.wMain.display()
             self.parentApp.changed = False
 
+    @profiled("fill in holes")
     def fill_in_holes(self, _input=None):
-        for resource in get_resource_list():
-            self.parentApp.mark_missing_dependencies(resource)
+        for resource_name in sorted(DEPENDENCY_INDEX.get_dangling()):
+            self.parentApp.push(resource_name)
         if len(self.parentApp.active_resource) > 0:
             self.parentApp.last_resource_object = None
             self.parentApp.switchForm("ADD_QUEUE")
 
+    def refresh_store(self):
+        if len(refresh_resources()) > 0:
+            self.parentApp.changed = True
+            self.update_listing()
+
     def while_editing(self, *args, **kwargs):
+        self.refresh_store()
         self.fill_in_holes()
 
     def beforeEditing(self):
+        self.refresh_store()
         self.update_listing()
 
     def on_ok(self):
         print("values", self.resource_list.values)
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Without a command, start the interactive app"
+    )
+    commands = parser.add_subparsers(dest="command")
+    for command, help_text in (
+        ("bom", "Raw materials needed, sorted by name"),
+        ("plan", "Order in which to build everything, deepest first"),
+        ("schedule", "Build plan spread over parallel crafting stations"),
+    ):
+        subparser = commands.add_parser(command, help=help_text)
+        subparser.add_argument("resource")
+        subparser.add_argument("quantity", type=int, nargs="?", default=1)
+        subparser.add_argument("-o", "--output", help="Write here, not stdout")
+    subparser.add_argument(
+        "-d",
+        "--durations",
+        required=True,
+        help="JSON file of time per craft by resource name",
+    )
+    subparser.add_argument(
+        "-m", "--machines", type=int, default=1, help="Machines at the one station"
+    )
+    subparser.add_argument(
+        "-s",
+        "--stations",
+        help='JSON file of {"stations": {station: machines}, '
+        '"resources": {resource: station}}, instead of --machines',
+    )
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        GleanApp().run()
+        return
+    if args.quantity < 1:
+        parser.error(f"Quantity must be at least 1, not {args.quantity}")
+    resource = get_resource(args.resource)
+    if resource is None:
+        parser.error(f"No such resource: {args.resource}")
+    missing = missing_dependencies(resource)
+    if len(missing) > 0:
+        parser.error(f"Not defined: {', '.join(sorted(missing))}")
+    if args.command == "bom":
+        rows = iter_BOM(resource, args.quantity)
+    elif args.command == "plan":
+        rows = iter_build_plan(resource, args.quantity)
+    else:
+        stations, station_for = args.machines, None
+        try:
+            with open(args.durations) as file:
+                durations = json.load(file)
+            if args.stations is not None:
+                with open(args.stations) as file:
+                    layout = json.load(file)
+                stations = layout["stations"]
+                station_for = layout.get("resources")
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"Can't read the schedule setup: {e}")
+        try:
+            schedule = schedule_plan(
+                build_plan(resource, args.quantity), durations, stations, station_for
+            )
+        except (KeyError, ValueError) as e:
+            parser.error(e.args[0])
+        rows = None
+
+    # only opened once the arguments checked out, so a bad call can't
+    # truncate an existing file
+    if args.output is None:
+        file = contextlib.nullcontext(sys.stdout)
+    else:
+        try:
+            file = open(args.output, "w")
+        except OSError as e:
+            parser.error(f"Can't write {args.output}: {e.strerror}")
+    with file as output:
+        if rows is None:
+            output.write(f"{schedule}\n")
+        else:
+            write_rows(rows, output)
+
+
 if __name__ == "__main__":
-    GleanApp().run()
+    main()
@@ -0,0 +1,188 @@
+import collections
+import random
+
+import pytest
+
+import glean
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    "Every test gets an empty resource directory and fresh module state"
+    monkeypatch.setattr(glean, "RESOURCES_DIR", str(tmp_path))
+    monkeypatch.setattr(glean, "RESOURCES_DEFINED", dict())
+    monkeypatch.setattr(glean, "DEPENDENCY_INDEX", glean.DependencyIndex())
+    monkeypatch.setattr(glean, "SHARED_STORE", glean.SharedStore())
+
+
+def define(resource_name, dependencies, output_yield=1):
+    resource = glean.Resource(resource_name, dependencies)
+    resource.yields[0] = output_yield
+    resource.register()
+    return resource
+
+
+def random_graph(rng, count=300, raw=20):
+    "n0..n{raw-1} are raw, the rest depend on a few earlier resources"
+    for i in range(count):
+        dependencies = dict()
+        if i >= raw:
+            for _ in range(rng.randint(1, 3)):
+                dependencies[f"n{rng.randrange(max(0, i - 60), i)}"] = rng.randint(1, 4)
+        define(f"n{i}", dependencies, rng.choice([1, 1, 2, 3, 5]))
+    return count
+
+
+def random_scenario(rng, count, raw=20):
+    scenario = glean.Scenario()
+    for _ in range(rng.randint(1, 6)):
+        resource_name = f"n{rng.randrange(raw, count)}"
+        dependencies = scenario.get_dependencies(resource_name)
+        action = rng.random()
+        if action < 0.3 and len(dependencies) > 0:
+            scenario.remove_dependency(resource_name, rng.choice(list(dependencies)))
+        elif action < 0.5:
+            scenario.set_yield(resource_name, rng.randint(1, 6))
+        elif action < 0.6:
+            scenario.reset(resource_name, rng.choice(list(dependencies) or ["n0"]))
+        else:
+            dependency = f"n{rng.randrange(0, int(resource_name[1:]))}"
+            try:
+                scenario.set_dependency(resource_name, dependency, rng.randint(1, 5))
+            except glean.CircularDependenciesError:
+                pass
+    return scenario
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_scenario_demand_matches_full_pass(seed):
+    rng = random.Random(seed)
+    count = random_graph(rng)
+    for _ in range(100):
+        scenario = random_scenario(rng, count)
+        resource = glean.get_resource(f"n{rng.randrange(count - 100, count)}")
+        quantity = rng.randint(1, 20)
+        order, level, made, raw = glean.propagate_demand(
+            resource, quantity, scenario.dependencies, scenario.output_yield
+        )
+        got_order, got_level, got_made, got_raw = scenario.demand(
+            resource.resource_name, quantity
+        )
+        assert set(got_order) == set(order)
+        assert got_level == level
+        assert dict(got_made) == dict(made)
+        assert dict(got_raw) == dict(raw)
+        assert dict(scenario.get_BOM(resource.resource_name, quantity)) == dict(raw)
+
+        plan = scenario.build_plan(resource.resource_name, quantity)
+        assert dict(plan) == dict(made)
+        assert [level[node] for node, _ in plan] == sorted(level.values(), reverse=True)
+
+
+def test_scenario_follows_stored_changes():
+    define("ore", {})
+    define("wood", {})
+    define("plate", {"ore": 2})
+    define("stick", {"wood": 1})
+    define("gear", {"plate": 2, "stick": 1})
+    ore = glean.get_resource("ore")
+    # only the stick branch is overridden, so plate and ore come from the
+    # stored pass cached on gear
+    scenario = glean.Scenario()
+    scenario.set_yield("stick", 4)
+    assert scenario.get_BOM("gear", 2)[ore] == 8
+
+    glean.get_resource("plate").add_dependency("ore", 5)
+    assert scenario.get_BOM("gear", 2)[ore] == 20
+
+    glean.get_resource("plate").output_yield = 4
+    assert scenario.get_BOM("gear", 2)[ore] == 5
+
+    glean.get_resource("plate").remove_dependency("ore")
+    assert scenario.get_BOM("gear", 2)[ore] == 0
+
+
+def test_scenario_reset_edge_drops_empty_entry():
+    define("ore", {})
+    define("plate", {"ore": 2})
+    scenario = glean.Scenario()
+    scenario.reset("plate", "ore")
+    assert "plate" not in scenario.overrides
+
+    scenario.set_dependency("plate", "ore", 3)
+    scenario.reset("plate", "ore")
+    assert "plate" not in scenario.overrides
+    assert scenario.get_dependencies("plate") == {"ore": 2}
+
+
+def check_schedule(plan, schedule, durations, stations):
+    "Chunks add up to the plan, wait for their inputs and never share a machine"
+    finished = dict()
+    made = collections.Counter()
+    for step in schedule.steps:
+        made[step.resource] += step.quantity
+        finished[step.resource] = max(finished.get(step.resource, 0), step.finish)
+    assert made == collections.Counter(dict(plan))
+
+    for step in schedule.steps:
+        for dependency, _ in step.resource.dependencies:
+            assert step.start >= finished[dependency]
+        if step.station is None:
+            assert step.start == step.finish
+            continue
+        crafts = step.quantity
+        if len(step.resource._dependencies) > 0:
+            crafts //= step.resource.output_yield
+        duration = durations.get(step.resource.resource_name, 1)
+        assert step.finish - step.start == crafts * duration
+        assert 0 <= step.machine < stations[step.station]
+
+    by_machine = collections.defaultdict(list)
+    for step in schedule.steps:
+        if step.station is not None:
+            by_machine[step.station, step.machine].append((step.start, step.finish))
+    for intervals in by_machine.values():
+        intervals.sort()
+        for (_, finish), (start, _) in zip(intervals, intervals[1:]):
+            assert start >= finish
+    assert schedule.makespan == max(step.finish for step in schedule.steps)
+
+
+def test_schedule_splits_a_step_over_machines():
+    define("ore", {})
+    define("dust", {"ore": 1})
+    define("alloy", {"dust": 2})
+    plan = glean.build_plan(glean.get_resource("alloy"), 4)
+    schedule = glean.schedule_plan(plan, {"alloy": 1, "dust": 2}, 2)
+    check_schedule(plan, schedule, {"alloy": 1, "dust": 2}, {"station": 2})
+    # 8 dust on two machines, then 4 alloy on two machines
+    assert schedule.makespan == 8 + 2
+    assert schedule.utilization == {"station": 1}
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_schedule_random_plans(seed):
+    rng = random.Random(seed)
+    count = random_graph(rng, count=120)
+    durations = {f"n{i}": rng.randint(0, 5) for i in range(20, count)}
+    stations = {"bench": rng.randint(1, 4), "furnace": rng.randint(1, 4)}
+    station_for = {f"n{i}": rng.choice(list(stations)) for i in range(count)}
+    for _ in range(20):
+        plan = glean.build_plan(
+            glean.get_resource(f"n{rng.randrange(count - 40, count)}"),
+            rng.randint(1, 30),
+        )
+        schedule = glean.schedule_plan(plan, durations, stations, station_for)
+        check_schedule(plan, schedule, durations, stations)
+
+
+def test_schedule_needs_a_machine_per_station():
+    define("ore", {})
+    define("plate", {"ore": 1})
+    plan = glean.build_plan(glean.get_resource("plate"), 3)
+    with pytest.raises(ValueError):
+        glean.schedule_plan(plan, {}, 0)
+    with pytest.raises(ValueError):
+        glean.schedule_plan(plan, {}, {"bench": 1, "furnace": 0})
+    with pytest.raises(KeyError):
+        glean.schedule_plan(plan, {}, {"bench": 1, "furnace": 1})